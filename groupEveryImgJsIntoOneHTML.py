@@ -1,11 +1,49 @@
 import os
+import copy
+import argparse
+import mmap
+import stat
+import json
+import queue
 import base64
+import asyncio
+import hashlib
+import functools
+import importlib.util
+import contextlib
 import mimetypes
 from urllib.parse import unquote
 from typing import List
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, NavigableString
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Prefer the SIMD base64 encoder; fall back to the stdlib one
+try:
+    import pybase64
+    b64encode = pybase64.b64encode
+    b64encode_as_string = pybase64.b64encode_as_string
+except ImportError:
+    b64encode = base64.b64encode
+
+    def b64encode_as_string(data):
+        return base64.b64encode(data).decode('ascii')
+
+# Prefer the libxml2-backed parser; it builds and searches large trees much faster
+if importlib.util.find_spec('lxml') is not None:
+    HTML_PARSER = 'lxml'
+    SVG_PARSER = 'lxml-xml'
+else:
+    HTML_PARSER = 'html.parser'
+    SVG_PARSER = 'html.parser'
 
 # Register common MIME types that might be missing
 mimetypes.add_type('image/svg+xml', '.svg')
@@ -14,6 +52,63 @@ mimetypes.add_type('image/png', '.png')
 mimetypes.add_type('image/jpeg', '.jpg')
 mimetypes.add_type('image/jpeg', '.jpeg')
 
+# Tags whose resources are embedded, collected in a single find_all walk
+EMBED_TAGS = ['img', 'image', 'input', 'link', 'script']
+
+# Chunk size for streaming base64; a multiple of 3 so only the last chunk is padded
+B64_CHUNK_SIZE = 57 * 1024
+
+# Local files are read on a small thread pool with large read buffers
+LOCAL_READ_WORKERS = 8
+READ_BUFFER_SIZE = 1 << 20
+
+# Small local files are read into reusable buffers, one LIFO pool per
+# power-of-two size class; anything larger is memory-mapped instead
+POOL_MAX_BUFFER = 1 << 20
+_BUF_POOL = {
+    1 << n: queue.LifoQueue(maxsize=LOCAL_READ_WORKERS)
+    for n in range(POOL_MAX_BUFFER.bit_length())
+}
+
+# Tag levels below the document root that save_to_html streams instead of
+# serializing whole: <html>, then <head>/<body>
+SAVE_STREAM_DEPTH = 2
+
+# Data URI prefixes by MIME type; a handful of types cover nearly every image
+_PREFIX_CACHE = {}
+
+# <link rel> tokens that mark a favicon-style icon
+ICON_RELS = frozenset({
+    'icon', 'shortcut icon', 'apple-touch-icon', 'apple-touch-icon-precomposed',
+    'mask-icon', 'fluid-icon',
+})
+
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
+
+# Pooled session so downloads from the same host reuse keep-alive connections
+_SESSION = requests.Session()
+_SESSION.headers.update(HEADERS)
+_RETRY = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+_SESSION.mount('https://', HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=_RETRY))
+_SESSION.mount('http://', HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=_RETRY))
+
+# Magic-number signatures, checked in order against the first bytes of a file
+MAGIC_NUMBERS = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+# Leading bytes inspected when sniffing text formats such as SVG
+SNIFF_SIZE = 512
+
+# On-disk cache of encoded resources, keyed by URL or local path + mtime.
+# Entries are never evicted: every mtime change of a local asset adds another
+# full base64 copy, so the directory grows without bound. Delete it to reclaim space.
+CACHE_DIR = os.path.join('.cache', 'embed')
+# Per-input build manifest: input hash/mtime, local asset mtimes and output path
+MANIFEST_PATH = os.path.join('.cache', 'manifest.json')
+
 def get_mime_type(path_or_url, content_bytes):
     """
     Determine MIME type from extension or content signature.
@@ -23,24 +118,189 @@ def get_mime_type(path_or_url, content_bytes):
     if mime:
         return mime
         
-    # 2. Try magic numbers (signatures)
-    if content_bytes.startswith(b'\x89PNG\r\n\x1a\n'):
-        return 'image/png'
-    elif content_bytes.startswith(b'\xff\xd8'):
-        return 'image/jpeg'
-    elif content_bytes.startswith(b'GIF87a') or content_bytes.startswith(b'GIF89a'):
-        return 'image/gif'
-    elif content_bytes.startswith(b'RIFF') and content_bytes[8:12] == b'WEBP':
+    # 2. Try magic numbers (signatures), looking only at the start of the content
+    head = bytes(content_bytes[:16])
+    for signature, signature_mime in MAGIC_NUMBERS:
+        if head.startswith(signature):
+            return signature_mime
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
         return 'image/webp'
-    elif content_bytes.strip().startswith(b'<svg') or content_bytes.strip().startswith(b'<?xml'):
+    lead = bytes(content_bytes[:SNIFF_SIZE]).lstrip()
+    if lead.startswith(b'<svg') or lead.startswith(b'<?xml'):
         return 'image/svg+xml'
-        
+
     return 'application/octet-stream'
 
-def fetch_resource(src, base_file_path):
+def data_uri_prefix(mime):
+    """
+    Returns the shared "data:<mime>;base64," prefix string for a MIME type.
+    """
+    prefix = _PREFIX_CACHE.get(mime)
+    if prefix is None:
+        prefix = _PREFIX_CACHE.setdefault(mime, f"data:{mime};base64,")
+    return prefix
+
+
+def to_data_uri(mime, content):
+    """
+    Encodes content as a base64 data URI.
+    Large inputs are encoded in chunks into one preallocated buffer, so only
+    the buffer and the final string are alive at once.
+    """
+    prefix = data_uri_prefix(mime)
+    if len(content) <= B64_CHUNK_SIZE:
+        return prefix + b64encode_as_string(content)
+
+    head = prefix.encode('ascii')
+    buf = bytearray(len(head) + (len(content) + 2) // 3 * 4)
+    buf[:len(head)] = head
+    pos = len(head)
+    # Release the view promptly so an mmap'd source can be closed
+    with memoryview(content) as view:
+        for start in range(0, len(content), B64_CHUNK_SIZE):
+            chunk = b64encode(view[start:start + B64_CHUNK_SIZE])
+            buf[pos:pos + len(chunk)] = chunk
+            pos += len(chunk)
+    return buf.decode('ascii')
+
+
+def is_remote(src):
+    return src.startswith('http://') or src.startswith('https://')
+
+
+def resolve_local_path(src, base_file_path):
+    """
+    Resolves a local resource path relative to the HTML file.
+    """
+    if os.path.isabs(src):
+        return src
+    base_dir = os.path.dirname(os.path.abspath(base_file_path))
+    # Handle URL encoding in local paths (e.g. "My%20Image.png")
+    decoded_src = unquote(src)
+    return os.path.join(base_dir, decoded_src)
+
+
+def is_unreadable_local(path):
+    """
+    True if a local file exists with content but still failed to embed.
+    Missing or empty files are not failures: their mtime (or None) is in
+    the manifest, so the page is rebuilt once they change.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return stat.S_ISREG(st.st_mode) and st.st_size > 0
+
+
+def cache_key(src, base_file_path):
+    """
+    Returns the cache key for a resource, or None if the local file cannot be stat'ed.
+    Local keys include the file's mtime so edited files are re-encoded.
+    """
+    if is_remote(src):
+        ident = src.encode('utf-8')
+    else:
+        file_path = os.path.abspath(resolve_local_path(src, base_file_path))
+        try:
+            mtime = os.path.getmtime(file_path)
+        except OSError:
+            return None
+        ident = file_path.encode('utf-8') + b'|' + str(mtime).encode('ascii')
+    return hashlib.blake2b(ident, digest_size=16).hexdigest()
+
+
+def write_json_atomic(path, data):
+    """
+    Writes JSON through a temp file and os.replace, so readers never see a partial file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Unique per worker process; plain open() gives the file the umask's permissions
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_cached(key):
+    """
+    Returns the cached data URI for key, or None on a miss.
+    """
+    try:
+        with open(os.path.join(CACHE_DIR, f"{key}.json"), 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        return data_uri_prefix(entry['mime']) + entry['b64']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def store_cached(key, data_uri):
+    """
+    Writes a cache entry atomically so concurrent builds never see a partial file.
+    """
+    mime, _, b64_data = data_uri[len('data:'):].partition(';base64,')
+    try:
+        write_json_atomic(os.path.join(CACHE_DIR, f"{key}.json"), {'mime': mime, 'b64': b64_data})
+    except OSError as e:
+        print(f"  [!] Could not write cache entry {key}: {e}")
+
+
+def acquire_buffer(size):
+    """
+    Returns a pooled bytearray of at least size bytes (size <= POOL_MAX_BUFFER).
+    """
+    size_class = 1 << (size - 1).bit_length()
+    try:
+        return _BUF_POOL[size_class].get_nowait()
+    except queue.Empty:
+        return bytearray(size_class)
+
+
+def release_buffer(buf):
+    """
+    Returns a buffer from acquire_buffer to its pool; extras are dropped.
+    """
+    try:
+        _BUF_POOL[len(buf)].put_nowait(buf)
+    except queue.Full:
+        pass
+
+
+@contextlib.contextmanager
+def open_local(file_path, size):
+    """
+    Yields a read-only buffer over the first size bytes of a non-empty local file.
+    Small files are read into a pooled buffer, larger ones are memory-mapped.
+    Use as a context manager; the buffer is released on exit.
+    """
+    if size > POOL_MAX_BUFFER:
+        with open(file_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+                yield mm
+        return
+
+    buf = acquire_buffer(size)
+    try:
+        with memoryview(buf) as view:
+            with open(file_path, 'rb', buffering=READ_BUFFER_SIZE) as f:
+                read = f.readinto(view[:size])
+            with view[:read] as content:
+                yield content
+    finally:
+        release_buffer(buf)
+
+
+def fetch_resource(src, base_file_path, lazy=False):
     """
     Fetches the content of the image from URL or local path.
     Returns (content_bytes, mime_type) or (None, None) on failure.
+    With lazy=True, a local file whose MIME type is known from its extension
+    is not read; content is instead a callable returning an open_local context.
     """
     # Skip existing data URIs
     if src.strip().startswith('data:'):
@@ -50,11 +310,10 @@ def fetch_resource(src, base_file_path):
     mime = None
 
     # Case A: Remote URL
-    if src.startswith('http://') or src.startswith('https://'):
+    if is_remote(src):
         try:
             print(f"  Downloading: {src}")
-            headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
-            response = requests.get(src, headers=headers, timeout=15)
+            response = _SESSION.get(src, timeout=15, stream=False)
             response.raise_for_status()
             content = response.content
             mime = response.headers.get('Content-Type')
@@ -64,26 +323,32 @@ def fetch_resource(src, base_file_path):
     
     # Case B: Local file
     else:
-        # Resolve path relative to the HTML file
-        if os.path.isabs(src):
-            file_path = src
-        else:
-            base_dir = os.path.dirname(os.path.abspath(base_file_path))
-            # Handle URL encoding in local paths (e.g. "My%20Image.png")
-            decoded_src = unquote(src)
-            file_path = os.path.join(base_dir, decoded_src)
-
-        if os.path.exists(file_path) and os.path.isfile(file_path):
-            try:
-                # print(f"  Reading local file: {file_path}")
-                with open(file_path, 'rb') as f:
-                    content = f.read()
-            except Exception as e:
-                print(f"  [!] Error reading {file_path}: {e}")
-                return None, None
-        else:
+        file_path = resolve_local_path(src, base_file_path)
+        # One stat() answers both "exists" and "is a regular file"
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
             print(f"  [!] File not found: {file_path}")
             return None, None
+        if st.st_size == 0:
+            return None, None
+
+        if lazy:
+            mime, _ = mimetypes.guess_type(src)
+            if mime:
+                return functools.partial(open_local, file_path, st.st_size), mime
+        try:
+            # print(f"  Reading local file: {file_path}")
+            # Read straight into a buffer sized from the stat, avoiding read()'s extra copy
+            content = bytearray(st.st_size)
+            with open(file_path, 'rb', buffering=READ_BUFFER_SIZE) as f:
+                read = f.readinto(content)
+            del content[read:]
+        except Exception as e:
+            print(f"  [!] Error reading {file_path}: {e}")
+            return None, None
 
     # Determine MIME type if missing
     if not mime or mime == 'application/octet-stream':
@@ -91,6 +356,31 @@ def fetch_resource(src, base_file_path):
 
     return content, mime
 
+def encode_local(src, base_file_path, data_uri_by_digest):
+    """
+    Reads and encodes a local resource; runs on the local-read thread pool.
+    Files with a known extension are encoded straight from a pooled buffer
+    or a memory map. Files with identical bytes share one data URI through
+    data_uri_by_digest, which the pool's workers share.
+    Returns a data URI or None on failure.
+    """
+    content, mime = fetch_resource(src, base_file_path, lazy=True)
+    if not content:
+        return None
+    if callable(content):
+        with content() as buf:
+            return _encode_shared(mime, buf, data_uri_by_digest)
+    return _encode_shared(mime, content, data_uri_by_digest)
+
+
+def _encode_shared(mime, content, data_uri_by_digest):
+    digest = (hashlib.blake2b(content, digest_size=16).digest(), mime)
+    data_uri = data_uri_by_digest.get(digest)
+    if data_uri is None:
+        # Two workers racing on the same bytes may both encode; setdefault keeps one
+        data_uri = data_uri_by_digest.setdefault(digest, to_data_uri(mime, content))
+    return data_uri
+
 def convert_to_soup(html_file_path):
     if not os.path.exists(html_file_path):
         print(f"Error: Input file not found: {html_file_path}")
@@ -103,7 +393,7 @@ def convert_to_soup(html_file_path):
     
     try:
         with open(html_file_path, 'r', encoding='utf-8') as f:
-            soup = BeautifulSoup(f, 'html.parser')
+            soup = BeautifulSoup(f, HTML_PARSER)
     except Exception as e:
         print(f"Failed to parse HTML file: {e}")
         return
@@ -111,130 +401,509 @@ def convert_to_soup(html_file_path):
     return soup
 
 
-def embed_images(soup, html_file_path):
-    count = 0
-
-    # 1. Process <img> tags
-    img_tags = soup.find_all('img')
-    for img in img_tags:
-        if img.get('src'):
-            src = img['src']
-            content, mime = fetch_resource(src, html_file_path)
-            if content:
-                b64_data = base64.b64encode(content).decode('utf-8')
-                new_src = f"data:{mime};base64,{b64_data}"
-                img['src'] = new_src
-                # Remove srcset to prevent browser from loading external resources
-                if img.has_attr('srcset'):
-                    del img['srcset']
-                count += 1
-
-    # 2. Process <image> tags inside <svg>
-    svg_image_tags = soup.find_all('image')
-    for img in svg_image_tags:
-        href = img.get('href') or img.get('xlink:href')
+async def _fetch_async(session, src):
+    """
+    Downloads a remote resource on a shared aiohttp session.
+    Returns (content_bytes, mime_type) or (None, None) on failure.
+    """
+    try:
+        print(f"  Downloading: {src}")
+        async with session.get(src, headers=HEADERS) as response:
+            response.raise_for_status()
+            content = await response.read()
+            mime = response.headers.get('Content-Type')
+    except Exception as e:
+        # Name the type so exceptions with an empty message (e.g. TimeoutError) still say something
+        print(f"  [!] Error downloading {src}: {type(e).__name__}: {e}")
+        return None, None
+
+    if not mime or mime == 'application/octet-stream':
+        mime = get_mime_type(src, content)
+
+    return content, mime
+
+
+def resource_refs(tag):
+    """
+    Returns the (attr, src) pairs of a tag whose URLs are embedded as data URIs.
+    """
+    if tag.name == 'img':
+        # <img> tags
+        if tag.get('src'):
+            return [('src', tag['src'])]
+    elif tag.name == 'image':
+        # <image> tags inside <svg>
+        href = tag.get('href') or tag.get('xlink:href')
         if href:
-            content, mime = fetch_resource(href, html_file_path)
-            if content:
-                b64_data = base64.b64encode(content).decode('utf-8')
-                new_src = f"data:{mime};base64,{b64_data}"
-                if img.has_attr('href'):
-                    img['href'] = new_src
-                if img.has_attr('xlink:href'):
-                    img['xlink:href'] = new_src
-                count += 1
-
-    # 3. Process <input type="image">
-    input_tags = soup.find_all('input', type='image')
-    for inp in input_tags:
-        if inp.get('src'):
-            src = inp['src']
-            content, mime = fetch_resource(src, html_file_path)
-            if content:
-                b64_data = base64.b64encode(content).decode('utf-8')
-                inp['src'] = f"data:{mime};base64,{b64_data}"
-                count += 1
-
-    # 4. Process Favicons <link rel="icon">
-    link_tags = soup.find_all('link')
-    for link in link_tags:
-        rels = link.get('rel', [])
+            return [(attr, href) for attr in ('href', 'xlink:href') if tag.has_attr(attr)]
+    elif tag.name == 'input':
+        # <input type="image">
+        if tag.get('type') == 'image' and tag.get('src'):
+            return [('src', tag['src'])]
+    elif tag.name == 'link':
+        # Favicons <link rel="icon">
+        rels = tag.get('rel', [])
         if isinstance(rels, str): rels = [rels]
-        if any('icon' in r.lower() for r in rels) and link.get('href'):
-            href = link['href']
-            content, mime = fetch_resource(href, html_file_path)
-            if content:
-                b64_data = base64.b64encode(content).decode('utf-8')
-                link['href'] = f"data:{mime};base64,{b64_data}"
-                count += 1
+        if tag.get('href') and not ICON_RELS.isdisjoint(r.lower() for r in rels):
+            return [('href', tag['href'])]
+    return []
+
+
+def is_self_contained_svg(root):
+    """
+    Returns True if an <svg> tree renders the same, and stays inert, when inlined.
+    An SVG loaded from an <image> is an isolated document with scripting disabled,
+    so anything that could run script, leak styles or ids into the page, or
+    resolve a reference against the page's URL instead of the SVG's disqualifies it.
+    """
+    for element in [root] + root.find_all(True):
+        if element.name.lower() in ('script', 'style', 'foreignobject'):
+            return False
+        for attr, value in element.attrs.items():
+            attr = attr.lower()
+            if not isinstance(value, str):
+                value = ' '.join(value)
+            value = value.strip().lower()
+            if attr == 'id' or attr.startswith('on') or 'javascript:' in value:
+                return False
+            if attr.endswith('href') and not value.startswith(('#', 'data:')):
+                return False
+    return True
+
+
+def parse_svg(data_uri):
+    """
+    Decodes an SVG data URI and returns its root <svg> element.
+    Returns None if the SVG is unparsable or not self-contained (see
+    is_self_contained_svg), in which case it keeps its data URI.
+    """
+    try:
+        markup = base64.b64decode(data_uri.partition(';base64,')[2])
+        root = BeautifulSoup(markup, SVG_PARSER).find('svg')
+    except Exception as e:
+        print(f"  [!] Could not parse SVG: {e}")
+        return None
+    if root is None or not is_self_contained_svg(root):
+        return None
+    return root
+
+
+def inline_svg(soup, tag, svg_root):
+    """
+    Replaces an SVG <image> tag with a copy of the referenced <svg> element,
+    keeping the <image>'s own position, size and styling attributes.
+    A transform goes on a wrapping <g>, since nested <svg> does not take one in SVG 1.1.
+    """
+    svg = copy.copy(svg_root)
+    transform = None
+    for attr, value in tag.attrs.items():
+        if attr == 'transform':
+            transform = value
+        elif attr not in ('href', 'xlink:href'):
+            svg[attr] = value
+    if transform is None:
+        tag.replace_with(svg)
+    else:
+        group = soup.new_tag('g', attrs={'transform': transform})
+        group.append(svg)
+        tag.replace_with(group)
+
+
+async def embed_images_async(soup, html_file_path, assets=None, failed=None):
+    """
+    Replaces image and favicon URLs with base64 data URIs; SVGs referenced
+    from SVG <image> tags are inlined as markup, and so are local <script src> files.
+    All resources are fetched concurrently, then the soup is rewritten in one pass.
+    If assets is a dict, it is filled with {local_path: mtime} for every local
+    file the document references. If failed is a list, the src of every remote
+    image that could not be fetched, and of every local file that exists but
+    could not be read, is appended to it.
+    """
+    # Group references by URL in a single walk of the tree, so each unique
+    # resource is fetched only once
+    refs_by_src = {}
+    scripts = []
+    for tag in soup.find_all(EMBED_TAGS):
+        if tag.name == 'script':
+            # <script src> tags are inlined in the same pass
+            if tag.get('src'):
+                scripts.append(tag)
+            continue
+        for attr, src in resource_refs(tag):
+            # Skip existing data URIs
+            if src.strip().startswith('data:'):
+                continue
+            refs_by_src.setdefault(src, []).append((tag, attr))
+
+    if assets is not None:
+        # Record local dependencies for the build manifest
+        for src in refs_by_src:
+            if not is_remote(src):
+                path = os.path.abspath(resolve_local_path(src, html_file_path))
+                assets[path] = file_mtime(path)
+        for script in scripts:
+            path = resolve_script_path(script['src'], html_file_path)
+            if path:
+                assets[path] = file_mtime(path)
+
+    data_uris = {}
+    pending = []
+    for src in refs_by_src:
+        # Serve repeat builds straight from the on-disk cache
+        key = cache_key(src, html_file_path)
+        data_uri = load_cached(key) if key else None
+        if data_uri:
+            data_uris[src] = data_uri
+        else:
+            pending.append((src, key))
+
+    remote_srcs = [(src, key) for src, key in pending if is_remote(src)]
+    local_srcs = [(src, key) for src, key in pending if not is_remote(src)]
+
+    # Different URLs pointing at identical bytes share one data URI
+    data_uri_by_digest = {}
+
+    # Local reads are latency-bound, so keep several in flight on a thread pool
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=LOCAL_READ_WORKERS) as pool:
+        script_tasks = [loop.run_in_executor(pool, read_script, script['src'], html_file_path) for script in scripts]
+        local_tasks = [loop.run_in_executor(pool, encode_local, src, html_file_path, data_uri_by_digest) for src, _ in local_srcs]
+        if aiohttp is None:
+            # Without aiohttp, download on worker threads over the pooled requests session
+            remote_tasks = [asyncio.to_thread(fetch_resource, src, html_file_path) for src, _ in remote_srcs]
+            fetched = await asyncio.gather(*remote_tasks, *local_tasks, return_exceptions=True)
+        else:
+            # Reuse one session so TCP/TLS handshakes are shared across downloads
+            connector = aiohttp.TCPConnector(limit=10, limit_per_host=4)
+            # Time out per socket operation, not in total: a total timeout would also
+            # count the time a request waits for a free slot under limit_per_host
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=15)
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                remote_tasks = [_fetch_async(session, src) for src, _ in remote_srcs]
+                fetched = await asyncio.gather(*remote_tasks, *local_tasks, return_exceptions=True)
+        script_contents = await asyncio.gather(*script_tasks, return_exceptions=True)
+
+    remote_fetched = fetched[:len(remote_srcs)]
+    local_fetched = fetched[len(remote_srcs):]
+
+    for (src, key), outcome in zip(remote_srcs, remote_fetched):
+        if isinstance(outcome, BaseException):
+            print(f"  [!] Error fetching {src}: {type(outcome).__name__}: {outcome}")
+            continue
+        content, mime = outcome
+        if content:
+            data_uri = _encode_shared(mime, content, data_uri_by_digest)
+            if key:
+                store_cached(key, data_uri)
+            data_uris[src] = data_uri
+
+    # Local resources come back already encoded (and shared) by encode_local
+    for (src, key), outcome in zip(local_srcs, local_fetched):
+        if isinstance(outcome, BaseException):
+            print(f"  [!] Error reading {src}: {type(outcome).__name__}: {outcome}")
+            continue
+        if outcome:
+            if key:
+                store_cached(key, outcome)
+            data_uris[src] = outcome
+
+    if failed is not None:
+        failed.extend(
+            src for src in refs_by_src
+            if src not in data_uris
+            and (is_remote(src) or is_unreadable_local(resolve_local_path(src, html_file_path)))
+        )
+
+    svg_roots = {}
+    for src, targets in refs_by_src.items():
+        data_uri = data_uris.get(src)
+        if data_uri is None:
+            continue
+        for tag, attr in targets:
+            # SVG <image> tags get the referenced markup inlined instead of base64.
+            # The markup still comes from the shared encode/cache path, so the build
+            # pays one base64 decode per unique SVG; the output and browser do not
+            if tag.name == 'image' and data_uri.startswith('data:image/svg+xml'):
+                if src not in svg_roots:
+                    svg_roots[src] = parse_svg(data_uri)
+                if svg_roots[src] is not None:
+                    # A tag listed under both href and xlink:href is replaced once
+                    if tag.parent is not None:
+                        inline_svg(soup, tag, svg_roots[src])
+                    continue
+            tag[attr] = data_uri
+            # Remove srcset to prevent browser from loading external resources
+            if tag.name == 'img' and tag.has_attr('srcset'):
+                del tag['srcset']
+
+    for script, js_content in zip(scripts, script_contents):
+        src = script['src']
+        if isinstance(js_content, BaseException):
+            print(f"  [Error] Could not read {src}: {type(js_content).__name__}: {js_content}")
+        elif js_content is not None:
+            embed_script(script, js_content)
+            continue
+        # Remote scripts are left as-is on purpose; only local ones can fail
+        path = resolve_script_path(src, html_file_path)
+        if failed is not None and path and is_unreadable_local(path):
+            failed.append(src)
 
     return soup
 
 
+def embed_images(soup, html_file_path, assets=None, failed=None):
+    return asyncio.run(embed_images_async(soup, html_file_path, assets, failed))
+
+
+def write_node(f, soup, node, depth):
+    """
+    Writes node to the binary file f as UTF-8, matching str(soup)'s output.
+    Tags within depth levels are written as open tag, children, close tag,
+    so only one child below them is ever serialized in memory at a time.
+    """
+    if isinstance(node, NavigableString):
+        f.write(node.output_ready(formatter='minimal').encode('utf-8'))
+    elif depth == 0 or node.is_empty_element:
+        f.write(node.encode('utf-8', formatter='minimal'))
+    else:
+        # Serialize a childless copy of the tag to get its exact open/close markup
+        shell = soup.new_tag(node.name, nsprefix=node.prefix, attrs=dict(node.attrs))
+        close_tag = f"</{node.prefix}:{node.name}>" if node.prefix else f"</{node.name}>"
+        f.write(shell.decode(formatter='minimal')[:-len(close_tag)].encode('utf-8'))
+        for child in node.contents:
+            write_node(f, soup, child, depth - 1)
+        f.write(close_tag.encode('utf-8'))
+
+
 def save_to_html(soup, output_file_path):
-    # Save result
+    # Save result, streaming <html> and <head>/<body> open and close tags and
+    # encoding each of their children separately, so the whole document is
+    # never built as one string
     try:
-        with open(output_file_path, 'w', encoding='utf-8') as f:
-            f.write(str(soup))
+        with open(output_file_path, 'wb', buffering=1 << 20) as f:
+            for child in soup.contents:
+                write_node(f, soup, child, SAVE_STREAM_DEPTH)
         print(f"Saved to: {output_file_path}")
+        return True
     except Exception as e:
         print(f"Failed to save output: {e}")
+        return False
 
 
-def embed_js_in_html(soup, html_file_path, js_file_path: List[str] = None):
+def resolve_script_path(src, html_file_path):
     """
-    Parses an HTML file, finds all <script src="..."> tags pointing to local files,
-    reads the content of those files, and embeds them directly into the HTML.
+    Resolves a <script src> relative to the HTML file; None for remote scripts.
     """
+    if src.startswith(('http://', 'https://', '//')):
+        return None
+    html_dir = os.path.dirname(os.path.abspath(html_file_path))
+    return os.path.join(html_dir, src)
 
-    count = 0
-    script_tags = soup.find_all('script', src=True)
 
-    # Add addition JS files if provided
+def read_script(src, html_file_path):
+    """
+    Reads a local script referenced by <script src>.
+    Returns its text, or None for remote or unreadable scripts.
+    """
+    js_path = resolve_script_path(src, html_file_path)
+    # Skip remote scripts
+    if js_path is None:
+        print(f"  [Skipping remote] {src}")
+        return None
+
+    if os.path.exists(js_path) and os.path.isfile(js_path):
+        try:
+            with open(js_path, 'r', encoding='utf-8') as js_file:
+                return js_file.read()
+        except Exception as e:
+            print(f"  [Error] Could not read {js_path}: {e}")
+    else:
+        print(f"  [Warning] File not found: {js_path}")
+    return None
+
+
+def embed_script(script, js_content):
+    src = script['src']
+    # Remove the src attribute
+    del script['src']
+    # Embed the content
+    script.string = js_content
+    print(f"  [Embedded] {src}")
+
+
+def embed_js_in_html(soup, html_file_path, js_file_path: List[str] = None, assets=None, failed=None):
+    """
+    Appends additional JS files to <body> as inline <script> tags.
+    <script src> tags already in the document are inlined by embed_images,
+    in the same tree walk that embeds the images.
+    If assets is a dict, the appended files' mtimes are recorded in it;
+    if failed is a list, existing local files that could not be read are appended to it.
+    """
     if js_file_path:
         for js_path in js_file_path:
             script_tag = soup.new_tag('script', src=js_path)
             soup.body.append(script_tag)
-            script_tags.append(script_tag)
+            if assets is not None:
+                path = resolve_script_path(js_path, html_file_path)
+                if path:
+                    assets[path] = file_mtime(path)
+            js_content = read_script(js_path, html_file_path)
+            if js_content is not None:
+                embed_script(script_tag, js_content)
+            elif failed is not None:
+                path = resolve_script_path(js_path, html_file_path)
+                if path and is_unreadable_local(path):
+                    failed.append(js_path)
 
-    for script in script_tags:
-        src = script['src']
-        
-        # Skip remote scripts
-        if src.startswith(('http://', 'https://', '//')):
-            print(f"  [Skipping remote] {src}")
-            continue
+    return soup
 
-        # Resolve local path relative to the HTML file
-        html_dir = os.path.dirname(os.path.abspath(html_file_path))
-        js_path = os.path.join(html_dir, src)
-
-        if os.path.exists(js_path) and os.path.isfile(js_path):
-            try:
-                with open(js_path, 'r', encoding='utf-8') as js_file:
-                    js_content = js_file.read()
-                
-                # Remove the src attribute
-                del script['src']
-                # Embed the content
-                script.string = js_content
-                
-                print(f"  [Embedded] {src}")
-                count += 1
-            except Exception as e:
-                print(f"  [Error] Could not read {js_path}: {e}")
-        else:
-            print(f"  [Warning] File not found: {js_path}")
 
-    return soup
+def file_mtime(path):
+    """
+    Returns the mtime of path, or None if it does not exist.
+    """
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
 
 
-if __name__ == "__main__":
+def file_digest(path):
+    """
+    Returns a blake2b hex digest of a file's contents.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(functools.partial(f.read, READ_BUFFER_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-    input_file = "Never Split the Difference Negotiating As If Your Life Depended On It - Chris Voss.html"  # Default input file
+
+def load_manifest():
+    """
+    Returns the build manifest, or an empty one if it is missing or unreadable.
+    """
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def is_up_to_date(input_file, entry, js_file_path: List[str] = None):
+    """
+    Checks a manifest entry against the filesystem with a stat sweep.
+    The input is only re-hashed when its mtime has changed; if the content is
+    unchanged, the entry's mtime is refreshed in place so the next run skips the hash.
+    """
+    if not entry or entry.get('js') != list(js_file_path or []):
+        return False
+    # Never trust the cache for an output that has since been removed
+    if not os.path.exists(entry['output']):
+        return False
+    for path, mtime in entry['assets'].items():
+        if file_mtime(path) != mtime:
+            return False
+    mtime = file_mtime(input_file)
+    if mtime != entry['mtime']:
+        try:
+            if file_digest(input_file) != entry['content_hash']:
+                return False
+        except OSError:
+            return False
+        entry['mtime'] = mtime
+    return True
+
+
+def _process_one(input_file, js_file_path: List[str] = None):
+    """
+    Embeds every image and script of one HTML file into <name>_embedded.html.
+    Returns the file's manifest entry, or None on failure. No entry is returned
+    when a download or an existing local file failed to embed, so the next run
+    retries the file; missing local files are tracked through their asset mtime.
+    """
     soup = convert_to_soup(input_file)
-    soup = embed_images(soup, input_file)
-    soup = embed_js_in_html(soup, input_file, js_file_path=['chrome-extension/content.js'])
+    if soup is None:
+        return None
+    # Fingerprint the input before processing, so edits made meanwhile trigger a rebuild
+    mtime = file_mtime(input_file)
+    content_hash = file_digest(input_file)
+    assets = {}
+    failed = []
+    # embed_images runs its own event loop for this file's downloads
+    soup = embed_images(soup, input_file, assets=assets, failed=failed)
+    soup = embed_js_in_html(soup, input_file, js_file_path=js_file_path, assets=assets, failed=failed)
     base, ext = os.path.splitext(input_file)
     output_file = f"{base}_embedded{ext}"
-    save_to_html(soup, output_file)
+    if not save_to_html(soup, output_file):
+        return None
+    if failed:
+        print(f"  [!] {len(failed)} resource(s) not embedded; {input_file} will be rebuilt next run")
+        return None
+    return {
+        'mtime': mtime,
+        'content_hash': content_hash,
+        'assets': assets,
+        'js': list(js_file_path or []),
+        'output': os.path.abspath(output_file),
+    }
+
+
+def process_many(paths: List[str], js_file_path: List[str] = None):
+    """
+    Processes several HTML files in parallel, one per worker process,
+    so parsing and serialization are not serialized by the GIL.
+    Inputs whose manifest entry is still current are skipped entirely;
+    a file that raises is logged and left out of the manifest.
+    """
+    manifest = load_manifest()
+    original = copy.deepcopy(manifest)
+    stale = []
+    for path in paths:
+        if is_up_to_date(path, manifest.get(os.path.abspath(path)), js_file_path):
+            print(f"Up to date: {path}")
+        else:
+            stale.append(path)
+
+    if stale:
+        entries = []
+        with ProcessPoolExecutor() as pool:
+            futures = [pool.submit(_process_one, path, js_file_path) for path in stale]
+            # One bad input must not abort the batch; it just gets no manifest entry
+            for path, future in zip(stale, futures):
+                try:
+                    entries.append(future.result())
+                except Exception as e:
+                    print(f"[!] Failed to process {path}: {type(e).__name__}: {e}")
+                    entries.append(None)
+
+        for path, entry in zip(stale, entries):
+            if entry:
+                manifest[os.path.abspath(path)] = entry
+            else:
+                # Drop the old entry too, so a partial output is never trusted later
+                manifest.pop(os.path.abspath(path), None)
+
+    # Skip the write when nothing changed; an mtime refreshed by is_up_to_date counts
+    if manifest == original:
+        return
+    try:
+        write_json_atomic(MANIFEST_PATH, manifest)
+    except OSError as e:
+        print(f"[!] Could not write build manifest: {e}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Embed images and scripts into self-contained HTML files.")
+    parser.add_argument(
+        'input_files', nargs='*',
+        default=["Never Split the Difference Negotiating As If Your Life Depended On It - Chris Voss.html"],  # Default input file
+        help="HTML files to process; each is saved as <name>_embedded.html")
+    parser.add_argument(
+        '--js', action='append', dest='js_files', default=None,
+        help="extra JS file to append, relative to the HTML file (repeatable; default: chrome-extension/content.js)")
+    args = parser.parse_args()
+
+    js_files = args.js_files if args.js_files is not None else ['chrome-extension/content.js']
+    process_many(args.input_files, js_file_path=js_files)
@@ -1,6 +1,21 @@
 import markdown
 import os
 import sys
+import functools
+
+# One shared converter, so the 'extra' extensions are registered only once.
+# extensions=['extra'] enables features like tables, footnotes, etc.
+_MD = markdown.Markdown(extensions=['extra'])
+
+
+@functools.lru_cache(maxsize=32)
+def render_markdown(text):
+    """
+    Converts Markdown text to an HTML fragment, reusing the shared converter.
+    Identical text is served from the cache.
+    """
+    return _MD.reset().convert(text)
+
 
 def convert_markdown_to_html(input_file, output_file):
     """
@@ -15,8 +30,7 @@ def convert_markdown_to_html(input_file, output_file):
             text = f.read()
         
         # Convert markdown to html
-        # extensions=['extra'] enables features like tables, footnotes, etc.
-        html = markdown.markdown(text, extensions=['extra'])
+        html = render_markdown(text)
 
         # Wrap in a basic HTML structure if needed, or just output the fragment.
         # For a complete page, we might want to add <html><body>...